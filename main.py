@@ -1,17 +1,30 @@
 import os
+import csv
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Tuple, Optional
 
-import json
 import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
 import pyotp
 import pandas as pd
 import numpy as np
+import orjson
 import requests
 from dotenv import load_dotenv
 from SmartApi import SmartConnect
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional; the kernels below then run as plain Python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -20,6 +33,44 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+IST = timezone(timedelta(hours=5, minutes=30))
+
+class RateLimiter:
+    """Thread-safe limiter spacing calls evenly to at most `rate` per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+@dataclass(frozen=True)
+class Candles:
+    """Daily candles stored as one NumPy array per field, oldest bar first."""
+    timestamp: np.ndarray  # datetime64[s], IST wall-clock time
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.timestamp)
+
+    def take(self, index: np.ndarray) -> 'Candles':
+        return Candles(*(getattr(self, f.name)[index] for f in fields(self)))
+
+    @staticmethod
+    def concat(first: 'Candles', second: 'Candles') -> 'Candles':
+        return Candles(*(np.concatenate([getattr(first, f.name), getattr(second, f.name)]) for f in fields(first)))
+
 class AngelOneConnector:
     def __init__(self):
         self.api_key = os.getenv('ANGEL_ONE_APP_KEY')
@@ -29,56 +80,168 @@ class AngelOneConnector:
         self.api = None
         self.auth_token = None
         self.feed_token = None
+        self.session_file = os.path.expanduser("~/.cache/angelone_session.json")
+        self.session_ttl = timedelta(hours=8)
 
     def connect(self) -> bool:
         try:
             self.api = SmartConnect(api_key=self.api_key)
+            # Drop the cached tokens if the API rejects them, so the next run logs in again
+            self.api.setSessionExpiryHook(self._clear_cached_session)
+            if self._load_cached_session():
+                logger.info("Reusing cached Angel One session")
+                return True
+
             totp = pyotp.TOTP(self.totp_secret)
             data = self.api.generateSession(self.client_id, self.pin, totp.now())
             self.auth_token = data['data']['jwtToken']
             self.feed_token = data['data']['feedToken']
+            self._save_session()
             logger.info("Successfully connected to Angel One API")
             return True
         except Exception as e:
             logger.error(f"Error connecting to Angel One API: {str(e)}")
             return False
 
-    def get_historical_data(self, symbol_token: str, interval: str, from_date: str, to_date: str) -> Optional[pd.DataFrame]:
+    def _load_cached_session(self) -> bool:
+        if not os.path.exists(self.session_file):
+            return False
         try:
-            params = {
-                "exchange": "NSE",
-                "symboltoken": symbol_token,
-                "interval": interval,
-                "fromdate": from_date,
-                "todate": to_date
-            }
-            data = self.api.getCandleData(params)
-            
-            if 'data' not in data or not isinstance(data['data'], list):
-                logger.error(f"Unexpected response format: {data}")
-                return None
-            
-            if not data['data']:
-                logger.warning(f"No data returned for symbol token {symbol_token}")
-                return None
-            
-            df = pd.DataFrame(data['data'], columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            return df
+            with open(self.session_file, 'rb') as f:
+                session = orjson.loads(f.read())
         except Exception as e:
-            logger.error(f"Error fetching historical data: {str(e)}")
-            return None
+            logger.warning(f"Ignoring unreadable session cache: {str(e)}")
+            return False
+        if session.get('client_id') != self.client_id or session.get('exp', 0) <= time.time():
+            return False
+        if not all(key in session for key in ('jwt', 'refresh', 'feed')):
+            logger.warning("Ignoring incomplete session cache")
+            return False
+
+        self.api.setAccessToken(session['jwt'])
+        self.api.setRefreshToken(session['refresh'])
+        self.api.setFeedToken(session['feed'])
+        self.api.setUserId(self.client_id)
 
-    def close(self):
-        if self.api:
+        # The broker can revoke tokens early (e.g. a login from elsewhere), so confirm it still accepts them
+        try:
+            profile = self.api.getProfile(session['refresh'])
+            valid = isinstance(profile, dict) and profile.get('status') is True
+        except Exception as e:
+            logger.warning(f"Cached Angel One session check failed: {str(e)}")
+            valid = False
+        if not valid:
+            logger.info("Cached Angel One session is no longer valid, logging in again")
+            self._clear_cached_session()
+            self.api.setAccessToken(None)
+            self.api.setRefreshToken(None)
+            self.api.setFeedToken(None)
+            return False
+
+        self.auth_token = f"Bearer {session['jwt']}"
+        self.feed_token = session['feed']
+        return True
+
+    def _save_session(self) -> None:
+        session = {
+            'client_id': self.client_id,
+            'jwt': self.api.access_token,
+            'refresh': self.api.refresh_token,
+            'feed': self.feed_token,
+            'exp': self._session_expiry().timestamp()
+        }
+        try:
+            os.makedirs(os.path.dirname(self.session_file), exist_ok=True)
+            # The tokens grant account access, so keep the file private to the user
+            fd = os.open(self.session_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(orjson.dumps(session))
+        except OSError as e:
+            logger.warning(f"Could not cache Angel One session: {str(e)}")
+
+    def _session_expiry(self) -> datetime:
+        # Angel One resets sessions at midnight IST, so never trust a token past that
+        now = datetime.now(IST)
+        next_midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return min(now + self.session_ttl, next_midnight)
+
+    def _clear_cached_session(self) -> None:
+        try:
+            os.remove(self.session_file)
+        except FileNotFoundError:
+            pass
+
+    def get_historical_data(self, symbol_token: str, interval: str, from_date: str, to_date: str,
+                            rate_limiter: Optional[RateLimiter] = None, max_attempts: int = 3) -> Optional[Candles]:
+        params = {
+            "exchange": "NSE",
+            "symboltoken": symbol_token,
+            "interval": interval,
+            "fromdate": from_date,
+            "todate": to_date
+        }
+        for attempt in range(max_attempts):
+            if attempt:
+                # Full jitter, capped at 16s; the backoff only delays this request, not the rest of the scan
+                time.sleep(random.uniform(0, min(16, 2 ** attempt)))
+            if rate_limiter:
+                rate_limiter.wait()
+
+            try:
+                data = self.api.getCandleData(params)
+
+                if 'data' not in data or not isinstance(data['data'], list):
+                    logger.warning("Unexpected response format for symbol token %s: %s", symbol_token, data)
+                    continue
+
+                if not data['data']:
+                    logger.warning("No data returned for symbol token %s", symbol_token)
+                    return None
+
+                raw = data['data']
+                timestamps, opens, highs, lows, closes, volumes = zip(*raw)
+                return Candles(
+                    # Angel One reports IST as "YYYY-MM-DDTHH:MM:SS+05:30"; truncating to 19 chars keeps
+                    # the wall-clock time so cached and fresh bars compare directly
+                    timestamp=np.array(timestamps, dtype='U19').astype('datetime64[s]'),
+                    open=np.fromiter(opens, np.float64, len(raw)),
+                    high=np.fromiter(highs, np.float64, len(raw)),
+                    low=np.fromiter(lows, np.float64, len(raw)),
+                    close=np.fromiter(closes, np.float64, len(raw)),
+                    volume=np.fromiter(volumes, np.int64, len(raw))
+                )
+            except Exception as e:
+                logger.warning("Error fetching historical data for symbol token %s: %s", symbol_token, e)
+
+        logger.error("Failed to fetch historical data for symbol token %s after %d attempts", symbol_token, max_attempts)
+        return None
+
+    def get_historical_data_many(self, date_ranges: Dict[str, Tuple[str, str]], interval: str,
+                                 max_workers: int = 8, requests_per_second: float = 3) -> Dict[str, Optional[Candles]]:
+        # Angel One has no batch candle endpoint, so fan the per-token requests out under a shared rate limit
+        rate_limiter = RateLimiter(requests_per_second)
+
+        def fetch(symbol_token: str) -> Optional[Candles]:
+            from_date, to_date = date_ranges[symbol_token]
+            return self.get_historical_data(symbol_token, interval, from_date, to_date, rate_limiter)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(zip(date_ranges, executor.map(fetch, date_ranges)))
+
+    def close(self, logout: bool = False):
+        # The session is left open by default so the next run can reuse the cached tokens
+        if self.api and logout:
             self.api.terminateSession(self.client_id)
+            self._clear_cached_session()
         logger.info("Closed AngelOne connection")
 
 class InstrumentManager:
     def __init__(self):
         self.instruments_url = "https://margincalculator.angelbroking.com/OpenAPI_File/files/OpenAPIScripMaster.json"
         self.instruments_file = "instruments.json"
-        self.csv_file = "instruments.csv"
+        self.parquet_file = "instruments.parquet"
         self.instruments = None
+        self._token_by_symbol = {}
 
     def fetch_instruments(self) -> None:
         if self._should_update_file():
@@ -87,103 +250,158 @@ class InstrumentManager:
             self._load_instruments()
 
     def _download_instruments(self) -> None:
-        response = requests.get(self.instruments_url)
-        if response.status_code == 200:
-            self.instruments = response.json()
-            self._save_instruments()
-            logger.info("Instruments data fetched and saved successfully.")
-        else:
-            logger.error(f"Failed to fetch instruments. Status code: {response.status_code}")
+        with requests.Session() as session:
+            response = session.get(self.instruments_url, headers={'Accept-Encoding': 'gzip'}, stream=True)
+            if response.status_code == 200:
+                # Stream the payload straight to disk rather than re-serialising the parsed JSON
+                with open(self.instruments_file, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=1 << 20):
+                        f.write(chunk)
+                with open(self.instruments_file, 'rb') as f:
+                    self.instruments = orjson.loads(f.read())
+                self._build_token_index()
+                self._save_instruments()
+                logger.info("Instruments data fetched and saved successfully.")
+            else:
+                logger.error(f"Failed to fetch instruments. Status code: {response.status_code}")
 
     def _save_instruments(self) -> None:
-        with open(self.instruments_file, 'w') as f:
-            json.dump(self.instruments, f)
         df = pd.DataFrame(self.instruments)
-        df.to_csv(self.csv_file, index=False)
+        # Parse expiry once here so readers don't re-parse every row on each run
+        df['expiry_date'] = pd.to_datetime(df['expiry'], format='%d%b%Y', errors='coerce')
+        df.to_parquet(self.parquet_file, index=False, compression='zstd')
 
     def _load_instruments(self) -> None:
-        if os.path.exists(self.csv_file):
-            self.instruments = pd.read_csv(self.csv_file)
-            logger.info("Instruments data loaded successfully from CSV.")
+        if os.path.exists(self.parquet_file):
+            self.instruments = pd.read_parquet(self.parquet_file)
+            self._build_token_index()
+            logger.info("Instruments data loaded successfully from Parquet.")
         elif os.path.exists(self.instruments_file):
-            with open(self.instruments_file, 'r') as f:
-                self.instruments = json.load(f)
+            with open(self.instruments_file, 'rb') as f:
+                self.instruments = orjson.loads(f.read())
+            self._build_token_index()
             logger.info("Instruments data loaded successfully from JSON.")
         else:
             logger.error("Instruments file not found. Please run fetch_instruments() to download the data.")
 
     def _should_update_file(self) -> bool:
-        if not os.path.exists(self.instruments_file) and not os.path.exists(self.csv_file):
+        # prepare_stocks_to_scan reads the Parquet file, so a JSON-only cache still needs a refresh
+        if not os.path.exists(self.parquet_file):
             return True
-        file_to_check = self.csv_file if os.path.exists(self.csv_file) else self.instruments_file
-        file_mod_time = datetime.fromtimestamp(os.path.getmtime(file_to_check))
+        file_mod_time = datetime.fromtimestamp(os.path.getmtime(self.parquet_file))
         return file_mod_time.date() < datetime.now().date()
 
-    def get_symbol_token(self, symbol: str) -> Optional[str]:
-        if self.instruments is None:
-            self._load_instruments()
-        
+    def _build_token_index(self) -> None:
+        # First occurrence wins, matching the previous linear scan
         if isinstance(self.instruments, pd.DataFrame):
-            instrument = self.instruments[self.instruments['symbol'] == symbol]
-            return instrument.iloc[0]['token'] if not instrument.empty else None
+            instruments = self.instruments.drop_duplicates('symbol')
+            self._token_by_symbol = dict(zip(instruments['symbol'], instruments['token'].astype(str)))
         elif isinstance(self.instruments, list):
-            return next((instrument['token'] for instrument in self.instruments if instrument['symbol'] == symbol), None)
-        return None
-
-def prepare_stocks_to_scan(instruments_file: str, output_file: str) -> None:
-    df = pd.read_csv(instruments_file)
+            self._token_by_symbol = {}
+            for instrument in self.instruments:
+                self._token_by_symbol.setdefault(instrument['symbol'], instrument['token'])
 
-    # 1. Filter data for exch_seg="NFO" and instrumenttype="FUTSTK"
-    futures_df = df[(df['exch_seg'] == 'NFO') & (df['instrumenttype'] == 'FUTSTK')]
-
-    # 2. Filter for nearest expiry
-    today = datetime.now()
-    futures_df['expiry_date'] = pd.to_datetime(futures_df['expiry'], format='%d%b%Y')
-    futures_df = futures_df[futures_df['expiry_date'] >= today]
+    def get_symbol_token(self, symbol: str) -> Optional[str]:
+        if self.instruments is None:
+            self._load_instruments()
+        return self._token_by_symbol.get(symbol)
+
+def prepare_stocks_to_scan(instruments_file: str, output_file: str) -> List[str]:
+    # The stock list only changes when the instruments are refreshed, so reuse today's output if it is newer
+    if os.path.exists(output_file):
+        output_mod_time = os.path.getmtime(output_file)
+        if (datetime.fromtimestamp(output_mod_time).date() == datetime.now().date()
+                and output_mod_time >= os.path.getmtime(instruments_file)):
+            logger.info(f"{output_file} is up to date, skipping preparation")
+            return pd.read_csv(output_file)['symbol'].tolist()
+
+    # 1-2. Stock futures that haven't expired yet; the filters are pushed down into the Parquet
+    # reader so only matching rows of the two needed columns are materialised
+    # (expiry_date is parsed when the instruments are saved)
+    futures_df = pd.read_parquet(
+        instruments_file,
+        columns=['name', 'expiry_date'],
+        filters=[('exch_seg', '==', 'NFO'), ('instrumenttype', '==', 'FUTSTK'), ('expiry_date', '>=', datetime.now())]
+    )
     nearest_expiry = futures_df['expiry_date'].min()
-    futures_df = futures_df[futures_df['expiry_date'] == nearest_expiry]
 
-    # 3. Take just the name column
-    stock_names = futures_df['name'].unique()
+    # 3. Take the names of futures on the nearest expiry
+    stock_names = futures_df.loc[futures_df['expiry_date'] == nearest_expiry, 'name'].unique()
 
     # 4. Append "-EQ" to the names
-    stock_symbols = [f"{name}-EQ" for name in stock_names]
-
-    # 5. Search instrument universe for these symbols in NSE
-    nse_stocks = df[(df['exch_seg'] == 'NSE') & (df['symbol'].isin(stock_symbols))]
-
-    # 6. Take columns - token, symbol, name
-    result = nse_stocks[['token', 'symbol', 'name']]
+    stock_symbols = np.char.add(stock_names.astype(str), '-EQ')
+
+    # 5-6. Search instrument universe for these symbols in NSE, taking columns - token, symbol, name
+    if len(stock_symbols):
+        result = pd.read_parquet(
+            instruments_file,
+            columns=['token', 'symbol', 'name'],
+            filters=[('exch_seg', '==', 'NSE'), ('symbol', 'in', stock_symbols.tolist())]
+        )
+    else:
+        result = pd.DataFrame(columns=['token', 'symbol', 'name'])
 
     # 7. Save as stocks_to_scan.csv
     result.to_csv(output_file, index=False)
 
     logger.info(f"Saved {len(result)} stocks to {output_file}")
-
-def identify_breakout_breakdown(df: pd.DataFrame, symbol: str, lookback: int = 20) -> Tuple[bool, str, Dict[str, float]]:
-    if len(df) < lookback:
-        logger.debug(f"{symbol}: Not enough data for lookback period. Data points: {len(df)}")
+    return result['symbol'].tolist()
+
+# Explicit signature compiles eagerly at import (and cache=True persists it), so the scan never pays JIT cost.
+# fastmath is limited to flags that keep NaN semantics, since the kernel returns NaN for empty windows.
+@njit('UniTuple(f8, 4)(f8[::1], f8[::1], f8[::1], i8[::1], i8)', cache=True, boundscheck=False,
+      fastmath={'reassoc', 'contract', 'arcp'})
+def _breakout_kernel(high: np.ndarray, low: np.ndarray, close: np.ndarray, volume: np.ndarray,
+                     lookback: int) -> Tuple[float, float, float, float]:
+    """Return (previous_high, previous_low, atr, avg_volume) for the last bar.
+
+    Only the trailing windows the result depends on are visited, so older bars cost nothing.
+    """
+    n = high.shape[0]
+    atr_window = 14
+    range_start = max(n - 1 - lookback, 0)
+    atr_start = max(n - atr_window, 1)  # True range needs the previous close, so the first bar is skipped
+    volume_start = max(n - lookback, 0)
+
+    previous_high = np.nan
+    previous_low = np.nan
+    if range_start < n - 1:
+        previous_high = high[range_start]
+        previous_low = low[range_start]
+        for i in range(range_start + 1, n - 1):
+            previous_high = max(previous_high, high[i])
+            previous_low = min(previous_low, low[i])
+
+    tr_sum = 0.0
+    for i in range(atr_start, n):
+        tr_sum += max(high[i] - low[i], abs(high[i] - close[i - 1]), abs(low[i] - close[i - 1]))
+
+    volume_sum = 0.0
+    for i in range(volume_start, n):
+        volume_sum += volume[i]
+
+    atr = tr_sum / (n - atr_start) if n > atr_start else np.nan
+    avg_volume = volume_sum / (n - volume_start)
+    return previous_high, previous_low, atr, avg_volume
+
+def identify_breakout_breakdown(candles: Candles, symbol: str, lookback: int = 20) -> Tuple[bool, str, Dict[str, float]]:
+    n = len(candles)
+    if n < lookback:
+        logger.debug("%s: Not enough data for lookback period. Data points: %d", symbol, n)
         return False, "Insufficient Data", {}
 
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    df = df.sort_values('timestamp')
-    df['highest_high'] = df['high'].rolling(window=lookback, min_periods=1).max()
-    df['lowest_low'] = df['low'].rolling(window=lookback, min_periods=1).min()
-
-    current_close = df['close'].iloc[-1]
-    previous_high = df['highest_high'].iloc[-2]
-    previous_low = df['lowest_low'].iloc[-2]
-
-    logger.debug(f"{symbol}: Data points: {len(df)}, Current close: {current_close}, Previous high: {previous_high}, Previous low: {previous_low}")
+    previous_high, previous_low, atr, avg_volume = _breakout_kernel(
+        np.ascontiguousarray(candles.high, np.float64),
+        np.ascontiguousarray(candles.low, np.float64),
+        np.ascontiguousarray(candles.close, np.float64),
+        np.ascontiguousarray(candles.volume, np.int64),
+        lookback
+    )
+    current_close = candles.close[-1]
+    current_volume = candles.volume[-1]
 
-    df['tr'] = np.maximum(df['high'] - df['low'], 
-                          np.maximum(abs(df['high'] - df['close'].shift(1)),
-                                     abs(df['low'] - df['close'].shift(1))))
-    df['atr'] = df['tr'].rolling(window=14, min_periods=1).mean()
-
-    atr = df['atr'].iloc[-1]
-    avg_volume = df['volume'].rolling(window=lookback, min_periods=1).mean().iloc[-1]
-    current_volume = df['volume'].iloc[-1]
+    logger.debug("%s: Data points: %d, Current close: %s, Previous high: %s, Previous low: %s",
+                 symbol, n, current_close, previous_high, previous_low)
 
     details = {
         "current_close": current_close,
@@ -195,86 +413,116 @@ def identify_breakout_breakdown(df: pd.DataFrame, symbol: str, lookback: int = 2
     }
 
     # Check for upward breakout
-    if pd.notna(previous_high) and current_close > previous_high:
+    if not np.isnan(previous_high) and current_close > previous_high:
         breakout_size = current_close - previous_high
         details["breakout_size"] = breakout_size
-        logger.debug(f"{symbol}: Potential upward breakout detected. Size: {breakout_size}")
+        logger.debug("%s: Potential upward breakout detected. Size: %s", symbol, breakout_size)
 
         if breakout_size > atr:
             if current_volume > 1.5 * avg_volume:
-                logger.info(f"{symbol}: Full upward breakout confirmed")
+                logger.info("%s: Full upward breakout confirmed", symbol)
                 return True, "Full Upward Breakout", details
             else:
-                logger.debug(f"{symbol}: Partial upward breakout - Volume not significant enough")
+                logger.debug("%s: Partial upward breakout - Volume not significant enough", symbol)
                 return True, "Partial Upward Breakout - Low Volume", details
         else:
-            logger.debug(f"{symbol}: Partial upward breakout - Not significant enough")
+            logger.debug("%s: Partial upward breakout - Not significant enough", symbol)
             return True, "Partial Upward Breakout - Small Size", details
 
     # Check for downward breakdown
-    elif pd.notna(previous_low) and current_close < previous_low:
+    elif not np.isnan(previous_low) and current_close < previous_low:
         breakdown_size = previous_low - current_close
         details["breakdown_size"] = breakdown_size
-        logger.debug(f"{symbol}: Potential downward breakdown detected. Size: {breakdown_size}")
+        logger.debug("%s: Potential downward breakdown detected. Size: %s", symbol, breakdown_size)
 
         if breakdown_size > atr:
             if current_volume > 1.5 * avg_volume:
-                logger.info(f"{symbol}: Full downward breakdown confirmed")
+                logger.info("%s: Full downward breakdown confirmed", symbol)
                 return True, "Full Downward Breakdown", details
             else:
-                logger.debug(f"{symbol}: Partial downward breakdown - Volume not significant enough")
+                logger.debug("%s: Partial downward breakdown - Volume not significant enough", symbol)
                 return True, "Partial Downward Breakdown - Low Volume", details
         else:
-            logger.debug(f"{symbol}: Partial downward breakdown - Not significant enough")
+            logger.debug("%s: Partial downward breakdown - Not significant enough", symbol)
             return True, "Partial Downward Breakdown - Small Size", details
 
     else:
-        logger.debug(f"{symbol}: No breakout or breakdown detected")
+        logger.debug("%s: No breakout or breakdown detected", symbol)
         return False, "No Breakout/Breakdown", details
 
-# Update the scan_for_breakouts function to use the new identify_breakout_breakdown function
-def scan_for_breakouts(connector: AngelOneConnector, instrument_manager: InstrumentManager, symbols: List[str]) -> List[Dict[str, any]]:
-    breakout_stocks = []
-    delay = 1  # Start with a 1 second delay
+def _load_cached_history(cache_path: str) -> Optional[Candles]:
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with np.load(cache_path) as cached:
+            return Candles(**{f.name: cached[f.name] for f in fields(Candles)})
+    except Exception as e:
+        logger.warning("Ignoring unreadable history cache %s: %s", cache_path, e)
+        return None
+
+def _analyze_history(symbol: str, candles: Optional[Candles], cached: Optional[Candles],
+                     cache_path: str, start_date: datetime) -> Optional[Dict[str, any]]:
+    if candles is None or len(candles) == 0:
+        logger.warning("%s: No data retrieved", symbol)
+        return None
 
+    logger.debug("%s: Retrieved %d new bars of data", symbol, len(candles))
+    if cached is not None:
+        candles = Candles.concat(cached, candles)
+    # np.unique sorts by timestamp; scanning in reverse keeps the freshest copy of any re-fetched bar
+    _, reversed_index = np.unique(candles.timestamp[::-1], return_index=True)
+    candles = candles.take(len(candles) - 1 - reversed_index)
+    candles = candles.take(candles.timestamp >= np.datetime64(start_date, 's'))
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    np.savez(cache_path, **{f.name: getattr(candles, f.name) for f in fields(candles)})
+
+    is_breakout, breakout_type, details = identify_breakout_breakdown(candles, symbol)
+    if is_breakout:
+        return {
+            "symbol": symbol,
+            "breakout_type": breakout_type,
+            **details
+        }
+    return None
+
+def scan_for_breakouts(connector: AngelOneConnector, instrument_manager: InstrumentManager, symbols: List[str],
+                       max_workers: int = 8, requests_per_second: float = 3,
+                       cache_dir: str = "cache") -> List[Dict[str, any]]:
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=30)
+
+    symbol_tokens = {}
+    cached_history = {}
+    date_ranges = {}
     for symbol in symbols:
-        logger.info(f"Scanning {symbol}")
         symbol_token = instrument_manager.get_symbol_token(symbol)
-        if symbol_token:
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=30)
-            
-            for _ in range(3):  # Max 3 retries
-                try:
-                    df = connector.get_historical_data(
-                        symbol_token,
-                        "ONE_DAY",
-                        start_date.strftime("%Y-%m-%d %H:%M"),
-                        end_date.strftime("%Y-%m-%d %H:%M")
-                    )
-                    
-                    if df is not None and not df.empty:
-                        logger.debug(f"{symbol}: Retrieved {len(df)} days of data")
-                        is_breakout, breakout_type, details = identify_breakout_breakdown(df, symbol)
-                        if is_breakout:
-                            breakout_stocks.append({
-                                "symbol": symbol,
-                                "breakout_type": breakout_type,
-                                **details
-                            })
-                    else:
-                        logger.warning(f"{symbol}: No data retrieved")
-                    break  # Successful, exit the retry loop
-                except Exception as e:
-                    logger.error(f"Error processing {symbol}: {str(e)}")
-                    delay *= 2  # Exponential backoff
-                    time.sleep(delay)
-            else:
-                logger.error(f"Failed to process {symbol} after 3 attempts")
-        else:
-            logger.warning(f"Symbol token not found for {symbol}")
-        
-        time.sleep(delay)  # Wait before the next request
+        if not symbol_token:
+            logger.warning("Symbol token not found for %s", symbol)
+            continue
+        symbol_tokens[symbol] = symbol_token
+
+        cached = _load_cached_history(os.path.join(cache_dir, f"{symbol_token}.npz"))
+        fetch_from = start_date
+        if cached is not None and len(cached):
+            # Re-request the last cached bar as well, it may have still been forming when it was saved
+            fetch_from = max(start_date, cached.timestamp.max().astype(datetime))
+        cached_history[symbol_token] = cached
+        date_ranges[symbol_token] = (fetch_from.strftime("%Y-%m-%d %H:%M"), end_date.strftime("%Y-%m-%d %H:%M"))
+
+    logger.info("Fetching history for %d symbols", len(date_ranges))
+    history = connector.get_historical_data_many(date_ranges, "ONE_DAY", max_workers, requests_per_second)
+
+    breakout_stocks = []
+    for symbol, symbol_token in symbol_tokens.items():
+        logger.info("Scanning %s", symbol)
+        try:
+            result = _analyze_history(symbol, history[symbol_token], cached_history[symbol_token],
+                                      os.path.join(cache_dir, f"{symbol_token}.npz"), start_date)
+        except Exception as e:
+            logger.error("Error processing %s: %s", symbol, e)
+            continue
+        if result is not None:
+            breakout_stocks.append(result)
 
     return breakout_stocks
 
@@ -286,15 +534,19 @@ def save_breakout_results(breakout_stocks: List[Dict[str, any]]):
     current_time = datetime.now().strftime("%Y%m%d_%H%M%S")
     filename = f"breakout_stocks_{current_time}.csv"
     
-    df = pd.DataFrame(breakout_stocks)
-    df.to_csv(filename, index=False)
+    # Breakouts and breakdowns carry different size fields, so take the union of keys in first-seen order
+    fieldnames = list(dict.fromkeys(key for stock in breakout_stocks for key in stock))
+    with open(filename, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(breakout_stocks)
     logger.info(f"Saved breakout results to {filename}")
 
 def main():
     instrument_manager = InstrumentManager()
     instrument_manager.fetch_instruments()
 
-    prepare_stocks_to_scan("instruments.csv", "stocks_to_scan.csv")
+    stocks_to_scan = prepare_stocks_to_scan(instrument_manager.parquet_file, "stocks_to_scan.csv")
 
     connector = AngelOneConnector()
     if not connector.connect():
@@ -302,8 +554,6 @@ def main():
         return
 
     try:
-        stocks_to_scan = pd.read_csv("stocks_to_scan.csv")['symbol'].tolist()
-
         breakout_stocks = scan_for_breakouts(connector, instrument_manager, stocks_to_scan)
 
         save_breakout_results(breakout_stocks)